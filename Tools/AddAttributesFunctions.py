@@ -6,9 +6,13 @@ Last update: June 04, 2024
 Python version: 3+
 ArcGIS Pro: 2.6.4 and above """
 
+import itertools
 import math
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 
 import arcpy
@@ -20,10 +24,91 @@ from arcpy.sa import *
 from multiprocessing import Pool
 import multiprocessing
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional, without it the decorated functions run as plain python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 arcpy.CheckOutExtension("Spatial")
 
 # All the helper functions are defined here
 
+# verbosity of the messages: 1 reports the progress, 2 also reports the details of each feature
+# set the GA_SAMMT_VERBOSE environment variable to 2 to see the details
+VERBOSE = int(os.environ.get("GA_SAMMT_VERBOSE", "1"))
+# messages waiting to be passed to arcpy.AddMessage(), see addMessage()
+messageBuffer = []
+
+
+# This function buffers a message and passes the buffered messages to arcpy.AddMessage() in one go
+# Messages with a level higher than VERBOSE are ignored
+def addMessage(text, level=1):
+    # text: message text
+    # level: verbosity level of the message
+
+    if VERBOSE >= level:
+        messageBuffer.append(str(text))
+        if len(messageBuffer) >= 64:
+            flushMessages()
+    return
+
+
+# This function passes all the buffered messages to arcpy.AddMessage()
+def flushMessages():
+    if len(messageBuffer) > 0:
+        arcpy.AddMessage("\n".join(messageBuffer))
+        messageBuffer.clear()
+    return
+
+
+# set the GA_SAMMT_PROFILE environment variable to 1 to report the run time of the timed steps
+PROFILE = os.environ.get("GA_SAMMT_PROFILE", "0") == "1"
+# accumulated run time (nanoseconds) and number of runs of each timed step, see perfCounter()
+profileTimes = {}
+
+
+# This context manager adds the run time of the enclosed step to profileTimes when PROFILE is set
+@contextmanager
+def perfCounter(name):
+    # name: name of the timed step
+
+    if not PROFILE:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        total, count = profileTimes.get(name, (0, 0))
+        profileTimes[name] = (total + time.perf_counter_ns() - start, count + 1)
+
+
+# This function reports the accumulated run time of each timed step
+def flushProfileTimes():
+    for name, (total, count) in profileTimes.items():
+        seconds = round(total / 1e9, 3)
+        arcpy.AddMessage(
+            name + ": " + str(count) + " runs took " + str(seconds) + " seconds"
+        )
+    profileTimes.clear()
+    return
+
+
+# This function reports a feature that failed to be processed, together with the reason
+def reportFailure(featID, e):
+    # featID: featID of the feature
+    # e: the exception raised when processing the feature
+
+    # pass the buffered messages first to keep the messages in order
+    flushMessages()
+    arcpy.AddWarning("failed on " + str(featID) + ": " + str(e))
+    return
+
+
 # This function executes the multiprocessing to calculate the shape attributes for the bathymetric high features
 def execute_shape_BH(argList, n_cpu):
     # argList: a list of a list of arguments to be passed for multiprocessing
@@ -36,8 +121,12 @@ def execute_shape_BH(argList, n_cpu):
     multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'python.exe'))
     arcpy.AddMessage("nCPU:" + str(n_cpu))
     # doing multiprocessing here
+    # each subset is handed to the next idle process; the workers return nothing, so the results are discarded
     with Pool(n_cpu) as pool:
-        results = pool.map(add_shape_attributes_high_function, argList)
+        for _ in pool.imap_unordered(
+            add_shape_attributes_high_function, argList, chunksize=1
+        ):
+            pass
 
     arcpy.AddMessage("multiprocessing done all")
 
@@ -53,7 +142,10 @@ def execute_shape_BL(argList, n_cpu):
     arcpy.AddMessage("nCPU:" + str(n_cpu))
     # doing multiprocessing here
     with Pool(n_cpu) as pool:
-        results = pool.map(add_shape_attributes_low_function, argList)
+        for _ in pool.imap_unordered(
+            add_shape_attributes_low_function, argList, chunksize=1
+        ):
+            pass
 
     arcpy.AddMessage("multiprocessing done all")
 
@@ -69,7 +161,10 @@ def execute_profile_BH(argList, n_cpu):
     arcpy.AddMessage("nCPU:" + str(n_cpu))
     # doing multiprocessing here
     with Pool(n_cpu) as pool:
-        results = pool.map(add_profile_attributes_high_function, argList)
+        for _ in pool.imap_unordered(
+            add_profile_attributes_high_function, argList, chunksize=1
+        ):
+            pass
 
     arcpy.AddMessage("multiprocessing done all")
 
@@ -85,7 +180,10 @@ def execute_profile_BL(argList, n_cpu):
     arcpy.AddMessage("nCPU:" + str(n_cpu))
     # doing multiprocessing here
     with Pool(n_cpu) as pool:
-        results = pool.map(add_profile_attributes_low_function, argList)
+        for _ in pool.imap_unordered(
+            add_profile_attributes_low_function, argList, chunksize=1
+        ):
+            pass
 
     arcpy.AddMessage("multiprocessing done all")
 
@@ -314,39 +412,58 @@ def convert_backslash_forwardslash(inText):
     return inText
 
 
-# This function adds and calculates fields with Double type
-def addField(inFeat, joinFeat, fieldName, inID, joinID, expression):
+# the AddField_management() parameters of the field types used by addJoinedFields()
+JOINED_FIELD_PARAMETERS = {
+    "DOUBLE": {"field_precision": 15, "field_scale": 6},
+    "TEXT": {"field_length": 200},
+}
+
+
+# This function adds and calculates a number of fields from a joined featureclass
+# The fields of the inFeat are listed only once and the join is made only once for all the fields
+def addJoinedFields(inFeat, joinFeat, inID, joinID, fieldSpecs):
     # inFeat: input featureclass (or table)
     # joinFeat: feature (or table) to be joined with the inFeat
-    # fieldName: the field in the inFeat to be calculated from the joinFeat
     # inID: unique id field in the inFeat
     # joinID: unique id field in the joinFeat that matches the inID
-    # expression: expression text used to calculate the field
-
-    fieldType = "DOUBLE"
-    fieldPrecision = 15
-    fieldScale = 6
+    # fieldSpecs: a list of [fieldName, fieldType, expression] of the fields in the inFeat to be calculated from the joinFeat,
+    #             fieldType is one of the keys of JOINED_FIELD_PARAMETERS
 
     fields = arcpy.ListFields(inFeat)
     field_names = [f.name for f in fields]
 
-    if fieldName in field_names:
-        arcpy.AddMessage(fieldName + " exists and will be recalculated")
-    else:
-        arcpy.AddField_management(
-            inFeat, fieldName, fieldType, fieldPrecision, fieldScale
-        )
+    for fieldName, fieldType, expression in fieldSpecs:
+        if fieldName in field_names:
+            arcpy.AddMessage(fieldName + " exists and will be recalculated")
+        else:
+            arcpy.AddField_management(
+                inFeat, fieldName, fieldType, **JOINED_FIELD_PARAMETERS[fieldType]
+            )
 
     layerName = "tempLyr"
     arcpy.MakeFeatureLayer_management(inFeat, layerName)
     arcpy.AddJoin_management(layerName, inID, joinFeat, joinID, "KEEP_ALL")
 
-    arcpy.CalculateField_management(layerName, fieldName, expression, "PYTHON_9.3")
+    for fieldName, fieldType, expression in fieldSpecs:
+        arcpy.CalculateField_management(layerName, fieldName, expression, "PYTHON_9.3")
+        arcpy.AddMessage(fieldName + " added and calculated")
 
     arcpy.RemoveJoin_management(layerName, joinFeat)
 
     arcpy.Delete_management(layerName)
-    arcpy.AddMessage(fieldName + " added and calculated")
+    return
+
+
+# This function adds and calculates fields with Double type
+def addField(inFeat, joinFeat, fieldName, inID, joinID, expression):
+    # inFeat: input featureclass (or table)
+    # joinFeat: feature (or table) to be joined with the inFeat
+    # fieldName: the field in the inFeat to be calculated from the joinFeat
+    # inID: unique id field in the inFeat
+    # joinID: unique id field in the joinFeat that matches the inID
+    # expression: expression text used to calculate the field
+
+    addJoinedFields(inFeat, joinFeat, inID, joinID, [[fieldName, "DOUBLE", expression]])
     return
 
 
@@ -356,12 +473,13 @@ def deleteFields(inFeat, fieldsTokeep):
     # inFeat: input featureclass (or table)
     # fieldsToKeep: a list of field names in inFeat to be kept
 
-    fieldList = arcpy.ListFields(inFeat)
-    fieldsToDrop = []
-    for field in fieldList:
-        if not field.required:
-            if field.name not in fieldsTokeep:
-                fieldsToDrop.append(field.name)
+    # a set gives constant time membership tests
+    fieldsTokeep = set(fieldsTokeep)
+    fieldsToDrop = [
+        field.name
+        for field in arcpy.ListFields(inFeat)
+        if not field.required and field.name not in fieldsTokeep
+    ]
     if len(fieldsToDrop) > 0:
         arcpy.DeleteField_management(inFeat, fieldsToDrop)
     return
@@ -376,29 +494,7 @@ def addTextField(inFeat, joinFeat, fieldName, inID, joinID, expression):
     # joinID: unique id field in the joinFeat that matches the inID
     # expression: expression text used to calculate the field
 
-    fieldType = "TEXT"
-    fieldLength = 200
-
-    fields = arcpy.ListFields(inFeat)
-    field_names = [f.name for f in fields]
-
-    if fieldName in field_names:
-        arcpy.AddMessage(fieldName + " exists and will be recalculated")
-    else:
-        arcpy.AddField_management(
-            inFeat, fieldName, fieldType, field_length=fieldLength
-        )
-
-    layerName = "tempLyr"
-    arcpy.MakeFeatureLayer_management(inFeat, layerName)
-    arcpy.AddJoin_management(layerName, inID, joinFeat, joinID, "KEEP_ALL")
-
-    arcpy.CalculateField_management(layerName, fieldName, expression, "PYTHON_9.3")
-
-    arcpy.RemoveJoin_management(layerName, joinFeat)
-
-    arcpy.Delete_management(layerName)
-    arcpy.AddMessage(fieldName + " added and calculated")
+    addJoinedFields(inFeat, joinFeat, inID, joinID, [[fieldName, "TEXT", expression]])
     return
 
 
@@ -418,9 +514,11 @@ def addIDField(inFeat, fieldName):
     else:
         arcpy.AddField_management(inFeat, fieldName, fieldType, fieldPrecision)
 
-    expression = "!OBJECTID!"
-
-    arcpy.CalculateField_management(inFeat, fieldName, expression, "PYTHON_9.3")
+    # copy the OBJECTID values into the field with a cursor
+    with arcpy.da.UpdateCursor(inFeat, ["OID@", fieldName]) as cursor:
+        for row in cursor:
+            row[1] = row[0]
+            cursor.updateRow(row)
 
     arcpy.AddMessage(fieldName + " added and calculated")
     return
@@ -499,14 +597,13 @@ def calculateCircularity_Convexity_Solidity(workspace, inFeatClass):
     )
     # add area and perimeter fields of chFeat to inFeatClass
 
-    field = "convexhull_Area"
     inID = "featID"
     joinID = "featID"
-    expression = "!" + chFeat + "." + "SHAPE_AREA" + "!"
-    addField(inFeatClass, chFeat, field, inID, joinID, expression)
-    field = "convexhull_Perimeter"
-    expression = "!" + chFeat + "." + "SHAPE_LENGTH" + "!"
-    addField(inFeatClass, chFeat, field, inID, joinID, expression)
+    fieldSpecs = [
+        ["convexhull_Area", "DOUBLE", "!" + chFeat + "." + "SHAPE_AREA" + "!"],
+        ["convexhull_Perimeter", "DOUBLE", "!" + chFeat + "." + "SHAPE_LENGTH" + "!"],
+    ]
+    addJoinedFields(inFeatClass, chFeat, inID, joinID, fieldSpecs)
     arcpy.AddMessage("two convex hull fields added")
 
     fieldList = ["Circularity", "Convexity", "Solidity"]
@@ -583,17 +680,18 @@ def calculateSinuosity_LwR(workspace, tempFolder, inFeatClass, inBathy):
         inFeatClass, MbrFeatClass, "RECTANGLE_BY_WIDTH", "NONE", "", "MBG_FIELDS"
     )
     # add MBG_LENGTH, MBG_WIDTH AND MBG_ORIENTATION to inFeatClass
-    field = "rectangle_Length"
     inID = "featID"
     joinID = "featID"
-    expression = "!" + MbrFeatClass + "." + "MBG_Length" + "!"
-    addField(inFeatClass, MbrFeatClass, field, inID, joinID, expression)
-    field = "rectangle_Width"
-    expression = "!" + MbrFeatClass + "." + "MBG_Width" + "!"
-    addField(inFeatClass, MbrFeatClass, field, inID, joinID, expression)
-    field = "rectangle_Orientation"
-    expression = "!" + MbrFeatClass + "." + "MBG_Orientation" + "!"
-    addField(inFeatClass, MbrFeatClass, field, inID, joinID, expression)
+    fieldSpecs = [
+        ["rectangle_Length", "DOUBLE", "!" + MbrFeatClass + "." + "MBG_Length" + "!"],
+        ["rectangle_Width", "DOUBLE", "!" + MbrFeatClass + "." + "MBG_Width" + "!"],
+        [
+            "rectangle_Orientation",
+            "DOUBLE",
+            "!" + MbrFeatClass + "." + "MBG_Orientation" + "!",
+        ],
+    ]
+    addJoinedFields(inFeatClass, MbrFeatClass, inID, joinID, fieldSpecs)
     arcpy.AddMessage("three bounding rectangle fields added")
 
     fieldList = [
@@ -720,11 +818,7 @@ def calculateSinuosity_LwR(workspace, tempFolder, inFeatClass, inBathy):
                 headfootList.append(i)
 
     # generate 'head' and 'foot' featureclass
-    text = "("
-    for i in headfootList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in headfootList) + ")"
     pointFeat1 = workspace + "/" + "pointFeat1"
     itemList.append(pointFeat1)
     arcpy.Select_analysis(inFeatVertices, pointFeat1, whereClause)
@@ -814,20 +908,12 @@ def calculateSinuosity_LwR(workspace, tempFolder, inFeatClass, inBathy):
                 lastList.append(z2.index.values[0])
 
     # generate first points featureclass
-    text = "("
-    for i in firstList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in firstList) + ")"
     firstFeatClass = workspace + "/" + "firstPoints"
     itemList.append(firstFeatClass)
     arcpy.Select_analysis(pointFeat1, firstFeatClass, whereClause)
     # generate last points featureclass
-    text = "("
-    for i in lastList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in lastList) + ")"
     lastFeatClass = workspace + "/" + "lastPoints"
     itemList.append(lastFeatClass)
     arcpy.Select_analysis(pointFeat1, lastFeatClass, whereClause)
@@ -1030,11 +1116,7 @@ def calculate_segmentSlope(
         if len(ids_tobeDeleted) > 0:
             outFeat4 = "outFeat3_selected"
             itemList.append(outFeat4)
-            text = "("
-            for i in ids_tobeDeleted:
-                text = text + str(i) + ","
-            text = text[0:-1] + ")"
-            whereClause = "OBJECTID NOT IN " + text
+            whereClause = "OBJECTID NOT IN (" + ",".join(str(i) for i in ids_tobeDeleted) + ")"
             arcpy.Select_analysis(outFeat3, outFeat4, whereClause)
             arcpy.Copy_management(outFeat4, outFeat)
         else:
@@ -1457,17 +1539,18 @@ def calculateSinuosity_LwR_WdR_Slopes(
         inFeatClass, MbrFeatClass, "RECTANGLE_BY_WIDTH", "NONE", "", "MBG_FIELDS"
     )
     # add MBG_LENGTH, MBG_WIDTH AND MBG_ORIENTATION to inFeatClass
-    field = "rectangle_Length"
     inID = "featID"
     joinID = "featID"
-    expression = "!" + MbrFeatClass + "." + "MBG_Length" + "!"
-    addField(inFeatClass, MbrFeatClass, field, inID, joinID, expression)
-    field = "rectangle_Width"
-    expression = "!" + MbrFeatClass + "." + "MBG_Width" + "!"
-    addField(inFeatClass, MbrFeatClass, field, inID, joinID, expression)
-    field = "rectangle_Orientation"
-    expression = "!" + MbrFeatClass + "." + "MBG_Orientation" + "!"
-    addField(inFeatClass, MbrFeatClass, field, inID, joinID, expression)
+    fieldSpecs = [
+        ["rectangle_Length", "DOUBLE", "!" + MbrFeatClass + "." + "MBG_Length" + "!"],
+        ["rectangle_Width", "DOUBLE", "!" + MbrFeatClass + "." + "MBG_Width" + "!"],
+        [
+            "rectangle_Orientation",
+            "DOUBLE",
+            "!" + MbrFeatClass + "." + "MBG_Orientation" + "!",
+        ],
+    ]
+    addJoinedFields(inFeatClass, MbrFeatClass, inID, joinID, fieldSpecs)
     arcpy.AddMessage("three bounding rectangle fields added")
 
     # the list of attributes to be calculated and added
@@ -1615,11 +1698,7 @@ def calculateSinuosity_LwR_WdR_Slopes(
                 headfootList.append(i)
 
     # generate head and foot featureclass
-    text = "("
-    for i in headfootList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in headfootList) + ")"
     pointFeat1 = workspace + "/" + "pointFeat1"
     itemList.append(pointFeat1)
     arcpy.Select_analysis(inFeatVertices, pointFeat1, whereClause)
@@ -1729,36 +1808,20 @@ def calculateSinuosity_LwR_WdR_Slopes(
                 firstList.append(z1.index.values[0])
                 lastList.append(z2.index.values[0])
     # generate head featureclass
-    text = "("
-    for i in headList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in headList) + ")"
     arcpy.Select_analysis(pointFeat1, headFeatClass, whereClause)
     # generate foot featureclass
-    text = "("
-    for i in footList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in footList) + ")"
     arcpy.Select_analysis(pointFeat1, footFeatClass, whereClause)
     arcpy.AddMessage("generate head and foot features done")
 
     # generate first points featureclass
-    text = "("
-    for i in firstList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in firstList) + ")"
     firstFeatClass = workspace + "/" + "firstPoints"
     itemList.append(firstFeatClass)
     arcpy.Select_analysis(pointFeat1, firstFeatClass, whereClause)
     # generate last points featureclass
-    text = "("
-    for i in lastList:
-        text = text + str(i) + ","
-    text = text[0:-1] + ")"
-    whereClause = "OBJECTID IN " + text
+    whereClause = "OBJECTID IN (" + ",".join(str(i) for i in lastList) + ")"
     lastFeatClass = workspace + "/" + "lastPoints"
     itemList.append(lastFeatClass)
     arcpy.Select_analysis(pointFeat1, lastFeatClass, whereClause)
@@ -1782,7 +1845,7 @@ def calculateSinuosity_LwR_WdR_Slopes(
     # add x and y
     arcpy.AddXY_management(pointFeat2_1)
     arcpy.AddXY_management(pointFeat2_2)
-    print("Add x and y done")
+    arcpy.AddMessage("Add x and y done")
 
     # merge the first point, the centre points of each sub-polygon, then the last point
     mergedFeats = [firstFeatClass, pointFeat2_1, lastFeatClass]
@@ -2023,10 +2086,10 @@ def create_profiles1(inFeat, rectangleFeat, outPointFeat, tempFolder):
     matchcount = int(arcpy.management.GetCount(tempLayer)[0])
     if matchcount == 0:
         arcpy.FeatureToPoint_management(inFeat, centreFeat, "INSIDE")
-    arcpy.AddMessage("centre point generated")
+    addMessage("centre point generated", 2)
     # add x and y
     arcpy.AddXY_management(centreFeat)
-    arcpy.AddMessage("Add x and y to centre point")
+    addMessage("Add x and y to centre point", 2)
 
     cursor = arcpy.SearchCursor(rectangleFeat)
     row = cursor.next()
@@ -2093,7 +2156,7 @@ def create_profiles1(inFeat, rectangleFeat, outPointFeat, tempFolder):
         "angle",
         inFeat,
     )
-    arcpy.AddMessage(lineFC + " is created")
+    addMessage(lineFC + " is created", 2)
     # loop through each profile
     cursor = arcpy.SearchCursor(lineFC)
     mergeFCList = []
@@ -2173,7 +2236,7 @@ def create_profiles1(inFeat, rectangleFeat, outPointFeat, tempFolder):
     del cursor, row
 
     arcpy.Merge_management(mergeFCList, outPointFeat)
-    arcpy.AddMessage("merge done")
+    addMessage("merge done", 2)
     deleteDataItems(itemList)
 
 
@@ -2195,10 +2258,10 @@ def create_profiles2(inFeat, rectangleFeat, outPointFeat, tempFolder):
     MbrPoints = "bounding_rectangle_points"
     itemList.append(MbrPoints)
     arcpy.FeatureVerticesToPoints_management(rectangleFeat, MbrPoints, "ALL")
-    arcpy.AddMessage("bounding to points done")
+    addMessage("bounding to points done", 2)
     # add x and y
     arcpy.AddXY_management(MbrPoints)
-    arcpy.AddMessage("Add x and y done")
+    addMessage("Add x and y done", 2)
     # get x and y values for the starting and ending points
     cursor = arcpy.SearchCursor(MbrPoints)
     row = cursor.next()
@@ -2252,7 +2315,7 @@ def create_profiles2(inFeat, rectangleFeat, outPointFeat, tempFolder):
         templateExtent,
         geometryType,
     )
-    arcpy.AddMessage("Fishnet done")
+    addMessage("Fishnet done", 2)
 
     cursor = arcpy.SearchCursor(fishnetFeat)
     mergeFCList = []
@@ -2340,17 +2403,19 @@ def create_profiles2(inFeat, rectangleFeat, outPointFeat, tempFolder):
     del cursor, row
 
     if noFeat1 > 0:
-        arcpy.AddMessage(
-            str(noFeat1) + " cross-section profiles have actually been created."
+        addMessage(
+            str(noFeat1) + " cross-section profiles have actually been created.",
+            2,
         )
         arcpy.Merge_management(mergeFCList, outPointFeat)
-        arcpy.AddMessage("merge done")
+        addMessage("merge done", 2)
     # when none of the five cross-section profiles cross the input feature,
     # we force it to generate one profile passing through the centre point
     else:
-        arcpy.AddMessage(
+        addMessage(
             "None of the five cross-section profiles cross the input feature. "
-            + "Instead, we are creating one profile passing through the centre point."
+            + "Instead, we are creating one profile passing through the centre point.",
+            2,
         )
         create_profiles3(inFeat, rectangleFeat, outPointFeat, tempFolder)
 
@@ -2381,10 +2446,10 @@ def create_profiles3(inFeat, rectangleFeat, outPointFeat, tempFolder):
     matchcount = int(arcpy.management.GetCount(tempLayer)[0])
     if matchcount == 0:
         arcpy.FeatureToPoint_management(inFeat, centreFeat, "INSIDE")
-    arcpy.AddMessage("centre point generated")
+    addMessage("centre point generated", 2)
     # add x and y
     arcpy.AddXY_management(centreFeat)
-    arcpy.AddMessage("Add x and y to centre point")
+    addMessage("Add x and y to centre point", 2)
 
     cursor = arcpy.SearchCursor(rectangleFeat)
     row = cursor.next()
@@ -2444,7 +2509,7 @@ def create_profiles3(inFeat, rectangleFeat, outPointFeat, tempFolder):
         "angle",
         inFeat,
     )
-    arcpy.AddMessage(lineFC + " is created")
+    addMessage(lineFC + " is created", 2)
     # loop through each profile
     cursor = arcpy.SearchCursor(lineFC)
     mergeFCList = []
@@ -2520,7 +2585,7 @@ def create_profiles3(inFeat, rectangleFeat, outPointFeat, tempFolder):
     del cursor, row
 
     arcpy.Merge_management(mergeFCList, outPointFeat)
-    arcpy.AddMessage("merge done")
+    addMessage("merge done", 2)
     deleteDataItems(itemList)
 
 
@@ -2566,6 +2631,48 @@ def calculateSlopeThreshold(profileDF, depthCol, xCol, yCol):
     return slope
 
 
+# This function calculates, for each point in a profile, the mean slope from the point to the upstream points
+# and the mean slope from the point to the downstream points
+# It is compiled by numba when numba is available
+@njit(cache=True)
+def profilePointSlopes(xArr, yArr, depthArr):
+    # xArr: x coordinates of the profile points
+    # yArr: y coordinates of the profile points
+    # depthArr: depth values of the profile points
+    n = depthArr.size
+    upSlopeArr = np.empty(n)
+    downSlopeArr = np.empty(n)
+    for i in range(n):
+        upSum = 0.0
+        downSum = 0.0
+        for j in range(n):
+            if j == i:
+                continue
+            dist = np.sqrt((xArr[i] - xArr[j]) ** 2 + (yArr[i] - yArr[j]) ** 2)
+            if j < i:
+                # slope of the point to an upstream point
+                if dist == 0:
+                    upSum += 90.0
+                else:
+                    upSum += np.degrees(np.arctan((depthArr[i] - depthArr[j]) / dist))
+            else:
+                # slope of a downstream point to the point
+                if dist == 0:
+                    downSum += 90.0
+                else:
+                    downSum += np.degrees(np.arctan((depthArr[j] - depthArr[i]) / dist))
+        # the first (last) point has no upstream (downstream) section
+        if i == 0:
+            upSlopeArr[i] = np.nan
+        else:
+            upSlopeArr[i] = upSum / i
+        if i == n - 1:
+            downSlopeArr[i] = np.nan
+        else:
+            downSlopeArr[i] = downSum / (n - 1 - i)
+    return upSlopeArr, downSlopeArr
+
+
 # This is the main function conducting the profile analysis
 # The function is used to find knickpoint(s) along the profile
 def profileAnalysis(profileDF, depthCol, xCol, yCol, idArr, slopeThreshold):
@@ -2575,51 +2682,17 @@ def profileAnalysis(profileDF, depthCol, xCol, yCol, idArr, slopeThreshold):
     # yCol: the name of the y coordinate column in the profileDF
     # idArr: the id array
     # slopeThreshold: the designated slope threshold
-    s1List = []
-    s2List = []
-    # loop through each point in the profile
-    for i in profileDF.index:
-        # split the profile into two sections: upstream and downstream of the point
-        upstream = profileDF.loc[profileDF.index < i]
-        downstream = profileDF.loc[profileDF.index > i]
-        # get the x, y and depth values of the point being processed
-        x = profileDF.loc[i, xCol]
-        y = profileDF.loc[i, yCol]
-        depth = profileDF.loc[i, depthCol]
-        # doing upstream first
-        # calculating the slope of the point to each of the upstream point(s)
-        upSlopeList = []
-        if upstream.index.size == 0:
-            upSlope = np.nan
-        else:
-            for j in upstream.index:
-                x1 = upstream.loc[j, xCol]
-                y1 = upstream.loc[j, yCol]
-                depth1 = upstream.loc[j, depthCol]
-                dist1 = calculateDistance(x, y, x1, y1)
-                slope1 = calculateSlope(depth, depth1, dist1)
-                upSlopeList.append(slope1)
-            # slope of the upstream section is the mean of the individual upstream slopes
-            upSlope = np.mean(np.asarray(upSlopeList))
-        s1List.append(upSlope)
-        # doing the same for the downstream
-        downSlopeList = []
-        if downstream.index.size == 0:
-            downSlope = np.nan
-        else:
-            for j in downstream.index:
-                x1 = downstream.loc[j, xCol]
-                y1 = downstream.loc[j, yCol]
-                depth1 = downstream.loc[j, depthCol]
-                dist1 = calculateDistance(x, y, x1, y1)
-                slope1 = calculateSlope(depth1, depth, dist1)
-                downSlopeList.append(slope1)
-            downSlope = np.mean(np.asarray(downSlopeList))
-        s2List.append(downSlope)
+    # calculate the mean slopes of the upstream and downstream sections of each point
+    # the points in profileDF are ordered along the profile
+    upSlopeArr, downSlopeArr = profilePointSlopes(
+        profileDF[xCol].to_numpy(dtype=np.float64),
+        profileDF[yCol].to_numpy(dtype=np.float64),
+        profileDF[depthCol].to_numpy(dtype=np.float64),
+    )
 
     # add three new columns to the profile data
-    profileDF.loc[:, "upSlope"] = s1List
-    profileDF.loc[:, "downSlope"] = s2List
+    profileDF.loc[:, "upSlope"] = upSlopeArr
+    profileDF.loc[:, "downSlope"] = downSlopeArr
     profileDF.loc[:, "diffSlope"] = np.abs(
         profileDF.loc[:, "upSlope"] - profileDF.loc[:, "downSlope"]
     )
@@ -3202,8 +3275,6 @@ def splitFeat(workspace, inFeat, inBathy, noSplit):
     # inBathy: input bathymetry grid
     # noSplit: number of subsets to split
 
-    noFeat = int(arcpy.GetCount_management(inFeat).getOutput(0))
-    featCount = int(noFeat / noSplit)
     featList = []
     bathyList = []
     tempfolderList = []
@@ -3218,37 +3289,248 @@ def splitFeat(workspace, inFeat, inBathy, noSplit):
     i = 1
     while i <= noSplit:
         # create a File Geodatabase
-        gdbName = baseName + str(i) + '.gdb'
+        gdbName = f'{baseName}{i}.gdb'
+        gdbPath = f'{path}/{gdbName}'
         arcpy.CreateFileGDB_management(path, gdbName)
         arcpy.AddMessage(gdbName + ' created')
 
         # copy inBathy
-        data1 = path + '/' + gdbName + '/' + inBathy
+        data1 = f'{gdbPath}/{inBathy}'
         bathyList.append(data1)
         arcpy.Copy_management(inBathy, data1)
         arcpy.AddMessage(inBathy + ' copied')
 
-        # select a subset of inFeat depending on the number of splits
-        startID = (i-1)*featCount
-        if i == noSplit:
-            endID = noFeat
-        else:
-            endID = i*featCount
-        whereClause = '((OBJECTID > ' + str(startID) + ') And (OBJECTID <= ' + str(endID) + '))'
-        outFeat = path + '/' + gdbName + '/' + inFeat + '_' + str(i)
-        arcpy.analysis.Select(inFeat, outFeat, whereClause)
-        arcpy.AddMessage(outFeat + ' generated')
+        # the subset of inFeat is written by partitionFeat() below
+        outFeat = f'{gdbPath}/{inFeat}_{i}'
         featList.append(outFeat)
 
         # create temp folder
-        folderName = 'temp' + str(i)
+        folderName = f'temp{i}'
         arcpy.CreateFolder_management(path, folderName)
         arcpy.AddMessage(folderName + ' created')
-        tempFolder = path + '/' + folderName
+        tempFolder = f'{path}/{folderName}'
         tempfolderList.append(tempFolder)
         i += 1
+
+    # split inFeat into the subsets with a single scan of inFeat
+    partitionFeat(inFeat, featList)
     return featList, bathyList, tempfolderList
 
+
+# This function splits the input featureclass into subsets in a single pass,
+# the features are distributed in OBJECTID order so that each subset holds a contiguous range of features
+def partitionFeat(inFeat, outFeatList):
+    # inFeat: input featureclass
+    # outFeatList: a list of output featureclasses, one for each subset
+
+    noFeat = int(arcpy.GetCount_management(inFeat).getOutput(0))
+    noSplit = len(outFeatList)
+    # the first remainder subsets take one more feature, so that the subset sizes differ by at most one
+    featCount, remainder = divmod(noFeat, noSplit)
+    subsetEnds = list(
+        itertools.accumulate(
+            featCount + 1 if i < remainder else featCount for i in range(noSplit)
+        )
+    )
+
+    desc = arcpy.Describe(inFeat)
+    fieldNames = [
+        f.name for f in desc.fields if f.editable and f.type not in ("OID", "Geometry")
+    ]
+    cursorFields = ["SHAPE@"] + fieldNames
+
+    # create an empty featureclass with the same schema for each subset
+    insertCursors = []
+    for outFeat in outFeatList:
+        outPath, outName = os.path.split(outFeat)
+        arcpy.CreateFeatureclass_management(
+            outPath,
+            outName,
+            desc.shapeType,
+            inFeat,
+            "SAME_AS_TEMPLATE",
+            "SAME_AS_TEMPLATE",
+            desc.spatialReference,
+        )
+        insertCursors.append(arcpy.da.InsertCursor(outFeat, cursorFields))
+
+    try:
+        with arcpy.da.SearchCursor(
+            inFeat, cursorFields, sql_clause=(None, "ORDER BY OBJECTID")
+        ) as cursor:
+            i = 0
+            for k, row in enumerate(cursor):
+                # move on to the next subset once the current one is full
+                while k >= subsetEnds[i] and i < noSplit - 1:
+                    i += 1
+                insertCursors[i].insertRow(row)
+    finally:
+        # release the insert cursors so that the featureclasses are not locked
+        del insertCursors
+    for outFeat in outFeatList:
+        arcpy.AddMessage(outFeat + ' generated')
+    return
+
+
+# This function expands the bathymetry grid by filling the NoData cells next to the edge of the grid
+# with the mean of their valid neighbours in a 3 by 3 window
+# This is the same as mosaicking the 3 by 3 focal mean under the bathymetry grid, but done in a single pass
+def expand_bathy(inBathy, outBathy):
+    # inBathy: input bathymetry grid
+    # outBathy: output expanded bathymetry grid
+
+    bathyRas = arcpy.Raster(inBathy)
+    cellWidth = bathyRas.meanCellWidth
+    cellHeight = bathyRas.meanCellHeight
+    lowerLeft = bathyRas.extent.lowerLeft
+    spatialReference = bathyRas.spatialReference
+
+    bathyArray = arcpy.RasterToNumPyArray(bathyRas, nodata_to_value=np.nan).astype(
+        np.float32
+    )
+    nRows, nCols = bathyArray.shape
+    validArray = ~np.isnan(bathyArray)
+    # pad by one cell so that the border cells also have a full 3 by 3 window
+    valueArray = np.pad(np.where(validArray, bathyArray, 0), 1)
+    countArray = np.pad(validArray.astype(np.float32), 1)
+    sumArray = np.zeros_like(bathyArray)
+    nArray = np.zeros_like(bathyArray)
+    for i in range(3):
+        for j in range(3):
+            sumArray += valueArray[i : i + nRows, j : j + nCols]
+            nArray += countArray[i : i + nRows, j : j + nCols]
+    del valueArray, countArray  # to release memory
+
+    # only fill the NoData cells having at least one valid neighbour
+    fillMask = ~validArray & (nArray > 0)
+    bathyArray[fillMask] = sumArray[fillMask] / nArray[fillMask]
+    del sumArray, nArray, validArray, fillMask  # to release memory
+
+    newRaster = arcpy.NumPyArrayToRaster(
+        bathyArray, lowerLeft, cellWidth, cellHeight, np.nan
+    )
+    newRaster.save(outBathy)
+    if spatialReference.name != "Unknown":
+        arcpy.DefineProjection_management(outBathy, spatialReference)
+    del bathyArray  # to release memory
+    return
+
+
+# This function generates the bounding rectangle featureclass for the input featureclass
+# Number of features in the bounding rectangle is expected to be the same as in the input featureclass
+# if not, regenerate the bounding rectangle up to max_retries times
+def build_mbr(inFeatClass, outMbr, max_retries=3):
+    # inFeatClass: input Bathymetric High (Low) featureclass
+    # outMbr: output bounding rectangle featureclass
+    # max_retries: maximum number of times to regenerate the bounding rectangle
+
+    # count the features once; the count of the bounding rectangles is only refreshed after each regeneration
+    noFeat = int(arcpy.GetCount_management(inFeatClass).getOutput(0))
+    arcpy.AddMessage("noFeat: " + str(noFeat))
+
+    arcpy.MinimumBoundingGeometry_management(
+        inFeatClass, outMbr, "RECTANGLE_BY_WIDTH", "NONE", "", "MBG_FIELDS"
+    )
+    noRectangle = int(arcpy.GetCount_management(outMbr).getOutput(0))
+    arcpy.AddMessage("noRectangle: " + str(noRectangle))
+    attempts = 0
+    while noRectangle < noFeat and attempts < max_retries:
+        arcpy.MinimumBoundingGeometry_management(
+            inFeatClass, outMbr, "RECTANGLE_BY_WIDTH", "NONE", "", "MBG_FIELDS"
+        )
+        noRectangle = int(arcpy.GetCount_management(outMbr).getOutput(0))
+        arcpy.AddMessage("noRectangle: " + str(noRectangle))
+        attempts += 1
+
+    if noRectangle < noFeat:
+        arcpy.AddMessage(
+            "noRectangle: "
+            + str(noRectangle)
+            + " does not equal to noFeat: "
+            + str(noFeat)
+        )
+    return
+
+
+# This function calculates the profile attributes of all profiles of a feature
+# It does no geoprocessing so that it can run in a background thread
+def calculateProfileAttributes(points, attributeFunction, noAttribute):
+    # points: profile points of the feature as a pandas dataframe
+    # attributeFunction: calculate_profile_attributes_high or calculate_profile_attributes_low
+    # noAttribute: number of profile attributes returned by the attributeFunction
+
+    # sort the points by profileID, the stable sort keeps the order of the points along each profile
+    points = points.sort_values("profileID", kind="mergesort")
+    profileIDs = points["profileID"].to_numpy()
+    # the start and end positions of the contiguous points of each profile
+    boundaries = np.concatenate(
+        ([0], np.flatnonzero(np.diff(profileIDs)) + 1, [profileIDs.size])
+    )
+    if profileIDs.size > 0:
+        noProfile = boundaries.size - 1
+    else:
+        noProfile = 0
+    # one row for each of the profile attributes, one column for each profile
+    results = np.empty((noAttribute, noProfile), dtype=object)
+    # loop through each profile for the polygon feature
+    for j in range(noProfile):
+        pointsT = points.iloc[boundaries[j] : boundaries[j + 1]].copy()
+        depthCol = "RASTERVALU"
+        if pointsT.index.size > 10:
+            gap = 4
+        else:
+            gap = 3
+        results[:, j] = attributeFunction(pointsT, depthCol, "POINT_X", "POINT_Y", gap)
+
+    # for a polygon feature with five profiles, join all attribute values together as a string
+    valueList = [",".join(results[i]) for i in range(noAttribute)]
+    return valueList
+
+
+# This function adds the profile attributes calculated by calculateProfileAttributes() to the feature
+def writeProfileAttributes(featID, inFeat, future, fieldList):
+    # featID: featID of the feature
+    # inFeat: featureclass holding the feature
+    # future: future of calculateProfileAttributes() for the feature
+    # fieldList: a list of the profile attribute fields
+
+    try:
+        valueList = future.result()
+    except MemoryError:
+        raise
+    except Exception as e:
+        # any other failure in the profile calculation of a feature only skips that feature
+        reportFailure(featID, e)
+        return
+    addMessage(valueList, 2)
+    addMessage("profile attributes calculated", 2)
+
+    try:
+        fieldType = "TEXT"
+        fieldLength = 200
+        fields = arcpy.ListFields(inFeat)
+        field_names = [f.name for f in fields]
+        for field in fieldList:
+            if field in field_names:
+                addMessage(field + " exists", 2)
+            else:
+                arcpy.AddField_management(
+                    inFeat, field, fieldType, field_length=fieldLength
+                )
+        addMessage("profile fields added", 2)
+
+        # calculate all fields in a single pass
+        # calculate string to a text field, the string must be enclosed by double quote
+        fieldExpressions = [
+            [field, '"' + value + '"'] for field, value in zip(fieldList, valueList)
+        ]
+        arcpy.management.CalculateFields(inFeat, "PYTHON3", fieldExpressions)
+        addMessage("profile fields calculated", 2)
+    except (arcpy.ExecuteError, RuntimeError) as e:
+        reportFailure(featID, e)
+    return
+
+
 # This function calculates profile attributes for bathymetric high features
 def calculateProfileBH(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
     # workspaceName: input workspace
@@ -3279,27 +3561,9 @@ def calculateProfileBH(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
 
     # expand inBathy
     # This is to ensure that the profile point(s) at the edge of bathymetry grid have depth values
-    inFocal = inBathy + "_focal"
-    outFocalStat = FocalStatistics(
-        inBathy, NbrRectangle(3, 3, "CELL"), "MEAN", "DATA"
-    )
-    outFocalStat.save(inFocal)
-    # mosaic to new raster
-    mosaicBathy = "mosaicBathy"
-    inputRasters = [inBathy, inFocal]
-    arcpy.MosaicToNewRaster_management(
-        inputRasters,
-        workspaceName,
-        mosaicBathy,
-        inBathy,
-        "32_BIT_FLOAT",
-        "#",
-        "1",
-        "FIRST",
-        "FIRST",
-    )
+    mosaicBathy = f"{workspaceName}/mosaicBathy"
+    expand_bathy(inBathy, mosaicBathy)
     arcpy.AddMessage("mosaic done")
-    mosaicBathy = workspaceName + "/" + "mosaicBathy"
 
     mergeList = []
 
@@ -3313,55 +3577,23 @@ def calculateProfileBH(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
 
     # generate bounding rectangle
     MbrFeatClass = "bounding_rectangle"
-    arcpy.MinimumBoundingGeometry_management(
-        inFeatClass, MbrFeatClass, "RECTANGLE_BY_WIDTH", "NONE", "", "MBG_FIELDS"
-    )
+    build_mbr(inFeatClass, MbrFeatClass)
     arcpy.AddMessage("bounding rectangle generated")
-    noFeat = int(arcpy.GetCount_management(inFeatClass).getOutput(0))
-    noRectangle = int(arcpy.GetCount_management(MbrFeatClass).getOutput(0))
-    arcpy.AddMessage("noFeat: " + str(noFeat))
-    arcpy.AddMessage("noRectangle: " + str(noRectangle))
-    # Number of features in the bounding rectangle is expected to be the same as in the input featureclass
-    # if not, regenerate the bounding rectangle up to three times
-    if noRectangle < noFeat:
-        arcpy.MinimumBoundingGeometry_management(
-            inFeatClass,
-            MbrFeatClass,
-            "RECTANGLE_BY_WIDTH",
-            "NONE",
-            "",
-            "MBG_FIELDS",
-        )
-        noRectangle = int(arcpy.GetCount_management(MbrFeatClass).getOutput(0))
-        if noRectangle < noFeat:
-            arcpy.MinimumBoundingGeometry_management(
-                inFeatClass,
-                MbrFeatClass,
-                "RECTANGLE_BY_WIDTH",
-                "NONE",
-                "",
-                "MBG_FIELDS",
-            )
-            noRectangle = int(arcpy.GetCount_management(MbrFeatClass).getOutput(0))
-            if noRectangle < noFeat:
-                arcpy.MinimumBoundingGeometry_management(
-                    inFeatClass,
-                    MbrFeatClass,
-                    "RECTANGLE_BY_WIDTH",
-                    "NONE",
-                    "",
-                    "MBG_FIELDS",
-                )
-                noRectangle = int(
-                    arcpy.GetCount_management(MbrFeatClass).getOutput(0)
-                )
-                if noRectangle < noFeat:
-                    arcpy.AddMessage(
-                        "noRectangle: "
-                        + str(noRectangle)
-                        + " does not equal to noFeat: "
-                        + str(noFeat)
-                    )
+
+    # paths reused for every feature
+    featPrefix = f"{workspaceName}/inFeat_"
+    boundPrefix = f"{workspaceName}/boundFeat_"
+    # the profile points created for each feature are kept in the memory workspace
+    profilePointFC = "memory/profilePointFC"
+    profilePointFC1 = f"{workspaceName}/profilePointFC1"
+    outCSV = f"{tempFolder}/profilePointFC1.csv"
+    schemaFile = f"{tempFolder}/schema.ini"
+
+    # a single background thread calculates the profile attributes from the profile points,
+    # all the geoprocessing is kept in this thread
+    executor = ThreadPoolExecutor(max_workers=1)
+    # featID, inFeat and the future of the profile attributes of the previous feature
+    pending = None
 
     # loop through each input feature
     cursor = arcpy.SearchCursor(inFeatClass)
@@ -3372,180 +3604,95 @@ def calculateProfileBH(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
             arcpy.Compact_management(
                 workspaceName
             )  # compact the geodatabase to reduce its size and potentially improve the performance
-            arcpy.AddMessage("Compacted the geodatabase")
-        try:
-            itemList = []
-            featID = row.getValue("featID")
-            arcpy.AddMessage("working on feature: " + str(featID))
+            addMessage("Compacted the geodatabase")
+        itemList = []
+        featID = row.getValue("featID")
+        addMessage("working on feature: " + str(featID), 2)
 
-            LwR = row.getValue("LengthWidthRatio")
-            area = row.getValue("Shape_Area")
-            arcpy.AddMessage("area: " + str(area))
-            whereClause = '"featID" = ' + str(featID)
-            inFeat = workspaceName + "/" + "inFeat_" + str(featID)
-            mergeList.append(inFeat)
+        LwR = row.getValue("LengthWidthRatio")
+        area = row.getValue("Shape_Area")
+        addMessage("area: " + str(area), 2)
+        whereClause = f'"featID" = {featID}'
+        inFeat = f"{featPrefix}{featID}"
+        mergeList.append(inFeat)
 
+        try:
             # select the feature
             arcpy.Select_analysis(inFeatClass, inFeat, whereClause)
 
-            boundFeat = workspaceName + "/" + "boundFeat_" + str(featID)
+            boundFeat = f"{boundPrefix}{featID}"
             itemList.append(boundFeat)
 
             # select the feature
             arcpy.Select_analysis(MbrFeatClass, boundFeat, whereClause)
 
-            profilePointFC = workspaceName + "/" + "profilePointFC"
             itemList.append(profilePointFC)
 
             # depending on the following criteria, creating different profiles
             if (
                     area < areaThresholdValue
             ):  # for a smaller polygon feature, create only one profile. This would save time
-                time1 = datetime.now()
-                create_profiles3(
-                    inFeat, boundFeat, profilePointFC, tempFolder
-                )
-                time2 = datetime.now()
-                diff = time2 - time1
-                arcpy.AddMessage("took " + str(diff) + " to create profile3.")
+                with perfCounter("create_profiles3"):
+                    create_profiles3(inFeat, boundFeat, profilePointFC, tempFolder)
             elif (
                     LwR <= 5.0
             ):  # for a polygon feature that is not elongated, create five profiles passing through the polygon centre
-                time1 = datetime.now()
-                create_profiles1(
-                    inFeat, boundFeat, profilePointFC, tempFolder
-                )
-                time2 = datetime.now()
-                diff = time2 - time1
-                arcpy.AddMessage("took " + str(diff) + " to create profiles1.")
+                with perfCounter("create_profiles1"):
+                    create_profiles1(inFeat, boundFeat, profilePointFC, tempFolder)
             else:  # for an elongated polygon feature, create five profiles across the long axis of the polygon
-                time1 = datetime.now()
-                create_profiles2(
-                    inFeat, boundFeat, profilePointFC, tempFolder
-                )
-                time2 = datetime.now()
-                diff = time2 - time1
-                arcpy.AddMessage("took " + str(diff) + " to create profiles2.")
+                with perfCounter("create_profiles2"):
+                    create_profiles2(inFeat, boundFeat, profilePointFC, tempFolder)
 
             # extract depth values to profile points
-            profilePointFC1 = workspaceName + "/" + "profilePointFC1"
             itemList.append(profilePointFC1)
             ExtractValuesToPoints(profilePointFC, mosaicBathy, profilePointFC1)
-            arcpy.AddMessage("extract depth values done")
+            addMessage("extract depth values done", 2)
             # Add x and y
             arcpy.AddXY_management(profilePointFC1)
-            arcpy.AddMessage("Add x and y done")
+            addMessage("Add x and y done", 2)
             # export the table to a csv file
-            outCSV = tempFolder + "/" + "profilePointFC1.csv"
             itemList.append(outCSV)
             # delete schema.ini which may contains incorrect data types (2023-04-20)
-            schemaFile = tempFolder + "/" + "schema.ini"
             if os.path.isfile(schemaFile):
                 os.remove(schemaFile)
 
             arcpy.CopyRows_management(profilePointFC1, outCSV)
-            arcpy.AddMessage(outCSV + " is generated")
+            addMessage(outCSV + " is generated", 2)
             # read in the csv file as pandas dataframe
             points = pd.read_csv(outCSV, sep=",", header=0)
             points.set_index("OBJECTID", inplace=True)
 
-            # calculate profile attributes
-            profileIDList = np.unique(points.profileID)
-            shapeList = []
-            symmetryList = []
-            concaveList = []
-            topSlopeClassList = []
-            sideSlopeClassList = []
-            topDepthList = []
-            heightList = []
-            lengthList = []
-            # loop through each profile for the polygon feature
-            for profileID in profileIDList:
-                pointsT = points.loc[points.profileID == profileID].copy()
-                depthCol = "RASTERVALU"
-                if pointsT.index.size > 10:
-                    gap = 4
-                else:
-                    gap = 3
-                # calling the 'calculate_profile_attributes_high' function
-                (
-                    shape,
-                    symmetry,
-                    concave,
-                    topSlopeClass,
-                    sideSlopeClass,
-                    topDepth,
-                    height,
-                    length,
-                ) = calculate_profile_attributes_high(
-                    pointsT, depthCol, "POINT_X", "POINT_Y", gap
-                )
-                # append the profile attributes to the lists
-                shapeList.append(shape)
-                symmetryList.append(symmetry)
-                concaveList.append(concave)
-                topSlopeClassList.append(topSlopeClass)
-                sideSlopeClassList.append(sideSlopeClass)
-                topDepthList.append(topDepth)
-                heightList.append(height)
-                lengthList.append(length)
-
-            valueList = []
-            # for a polygon feature with five profiles, join all attribute values together as a string
-            shape = ",".join(shapeList)
-            symmetry = ",".join(symmetryList)
-            concave = ",".join(concaveList)
-            topSlopeClass = ",".join(topSlopeClassList)
-            sideSlopeClass = ",".join(sideSlopeClassList)
-            topDepth = ",".join(topDepthList)
-            height = ",".join(heightList)
-            length = ",".join(lengthList)
-
-            valueList.append(shape)
-            valueList.append(symmetry)
-            valueList.append(concave)
-            valueList.append(topSlopeClass)
-            valueList.append(sideSlopeClass)
-            valueList.append(topDepth)
-            valueList.append(height)
-            valueList.append(length)
-            arcpy.AddMessage(valueList)
-            arcpy.AddMessage("profile attributes calculated")
-
-            for field in fieldList:
-                fieldType = "TEXT"
-                fieldLength = 200
-                fields = arcpy.ListFields(inFeat)
-                field_names = [f.name for f in fields]
-                if field in field_names:
-                    arcpy.AddMessage(field + " exists")
-                else:
-                    arcpy.AddField_management(
-                        inFeat, field, fieldType, field_length=fieldLength
-                    )
-
-            arcpy.AddMessage("profile fields added")
-
-            # calculate fields
-            i = 0
-            for field in fieldList:
-                # calculate string to a text field, the string must be enclosed by double quote
-                expression = '"' + valueList[i] + '"'
-                arcpy.CalculateField_management(
-                    inFeat, field, expression, "PYTHON_9.3"
-                )
-                i += 1
-
-            arcpy.AddMessage("profile fields calculated")
-
-            # delete intermediate data
+            # delete intermediate data, the profile points are now held in memory
             deleteDataItems(itemList)
-            arcpy.AddMessage("intermediate data deleted")
-        except:
-            arcpy.AddMessage("failed on " + str(featID))
+            addMessage("intermediate data deleted", 2)
+        except MemoryError:
+            raise
+        except Exception as e:
+            # any other failure in generating the profiles of a feature only skips that feature,
+            # e.g. create_profiles1() fails when the feature has no bounding rectangle
+            reportFailure(featID, e)
             continue
+
+        # calculate the profile attributes of this feature in the background,
+        # while the profile points of the next feature are being generated
+        future = executor.submit(
+            calculateProfileAttributes,
+            points,
+            calculate_profile_attributes_high,
+            len(fieldList),
+        )
+        # add the profile attributes of the previous feature
+        if pending is not None:
+            writeProfileAttributes(*pending, fieldList)
+        pending = (featID, inFeat, future)
         k += 1
 
+    # add the profile attributes of the last feature
+    if pending is not None:
+        writeProfileAttributes(*pending, fieldList)
+    executor.shutdown()
+    flushMessages()
+    flushProfileTimes()
     del cursor, row
 
     # merge all individual features together
@@ -3553,15 +3700,13 @@ def calculateProfileBH(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
     arcpy.Merge_management(mergeList, mergedFeat)
     arcpy.AddMessage("merged all done")
 
-    # transfer the field values to inFeatClass
-
-    for field in fieldList:
-        inID = "featID"
-        joinID = "featID"
-        expression = "!" + mergedFeat + "." + field + "!"
-        addTextField(
-            inFeatClass, mergedFeat, field, inID, joinID, expression
-        )
+    # transfer the field values to inFeatClass, with a single join for all the fields
+    inID = "featID"
+    joinID = "featID"
+    fieldSpecs = [
+        [field, "TEXT", "!" + mergedFeat + "." + field + "!"] for field in fieldList
+    ]
+    addJoinedFields(inFeatClass, mergedFeat, inID, joinID, fieldSpecs)
 
     arcpy.AddMessage("Profile attributes added and calculated")
 
@@ -3595,27 +3740,9 @@ def calculateProfileBL(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
 
     # expand inBathy
     # This is to ensure that the profile point(s) at the edge of bathymetry grid have depth values
-    inFocal = inBathy + "_focal"
-    outFocalStat = FocalStatistics(
-        inBathy, NbrRectangle(3, 3, "CELL"), "MEAN", "DATA"
-    )
-    outFocalStat.save(inFocal)
-    # mosaic to new raster
-    mosaicBathy = "mosaicBathy"
-    inputRasters = [inBathy, inFocal]
-    arcpy.MosaicToNewRaster_management(
-        inputRasters,
-        workspaceName,
-        mosaicBathy,
-        inBathy,
-        "32_BIT_FLOAT",
-        "#",
-        "1",
-        "FIRST",
-        "FIRST",
-    )
+    mosaicBathy = f"{workspaceName}/mosaicBathy"
+    expand_bathy(inBathy, mosaicBathy)
     arcpy.AddMessage("mosaic done")
-    mosaicBathy = workspaceName + "/" + "mosaicBathy"
 
     mergeList = []
     # convert the input area unit to "SQUARE_KILOMETERS"
@@ -3629,54 +3756,24 @@ def calculateProfileBL(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
 
     # generate bounding rectangle
     MbrFeatClass = "bounding_rectangle"
-    arcpy.MinimumBoundingGeometry_management(
-        inFeatClass, MbrFeatClass, "RECTANGLE_BY_WIDTH", "NONE", "", "MBG_FIELDS"
-    )
-    noFeat = int(arcpy.GetCount_management(inFeatClass).getOutput(0))
-    noRectangle = int(arcpy.GetCount_management(MbrFeatClass).getOutput(0))
-    arcpy.AddMessage("noFeat: " + str(noFeat))
-    arcpy.AddMessage("noRectangle: " + str(noRectangle))
-    # Number of features in the bounding rectangle is expected to be the same as in the input featureclass
-    # if not, regenerate the bounding rectangle up to three times
-    if noRectangle < noFeat:
-        arcpy.MinimumBoundingGeometry_management(
-            inFeatClass,
-            MbrFeatClass,
-            "RECTANGLE_BY_WIDTH",
-            "NONE",
-            "",
-            "MBG_FIELDS",
-        )
-        noRectangle = int(arcpy.GetCount_management(MbrFeatClass).getOutput(0))
-        if noRectangle < noFeat:
-            arcpy.MinimumBoundingGeometry_management(
-                inFeatClass,
-                MbrFeatClass,
-                "RECTANGLE_BY_WIDTH",
-                "NONE",
-                "",
-                "MBG_FIELDS",
-            )
-            noRectangle = int(arcpy.GetCount_management(MbrFeatClass).getOutput(0))
-            if noRectangle < noFeat:
-                arcpy.MinimumBoundingGeometry_management(
-                    inFeatClass,
-                    MbrFeatClass,
-                    "RECTANGLE_BY_WIDTH",
-                    "NONE",
-                    "",
-                    "MBG_FIELDS",
-                )
-                noRectangle = int(
-                    arcpy.GetCount_management(MbrFeatClass).getOutput(0)
-                )
-                if noRectangle < noFeat:
-                    arcpy.AddMessage(
-                        "noRectangle: "
-                        + str(noRectangle)
-                        + " does not equal to noFeat: "
-                        + str(noFeat)
-                    )
+    build_mbr(inFeatClass, MbrFeatClass)
+    arcpy.AddMessage("bounding rectangle generated")
+
+    # paths reused for every feature
+    featPrefix = f"{workspaceName}/inFeat_"
+    boundPrefix = f"{workspaceName}/boundFeat_"
+    # the profile points created for each feature are kept in the memory workspace
+    profilePointFC = "memory/profilePointFC"
+    profilePointFC1 = f"{workspaceName}/profilePointFC1"
+    outCSV = f"{tempFolder}/profilePointFC1.csv"
+    schemaFile = f"{tempFolder}/schema.ini"
+
+    # a single background thread calculates the profile attributes from the profile points,
+    # all the geoprocessing is kept in this thread
+    executor = ThreadPoolExecutor(max_workers=1)
+    # featID, inFeat and the future of the profile attributes of the previous feature
+    pending = None
+
     cursor = arcpy.SearchCursor(inFeatClass)
     # loop through each feature
     k = 1
@@ -3686,192 +3783,107 @@ def calculateProfileBL(workspaceName, tempFolder, inFeatClass, inBathy, areaT):
             arcpy.Compact_management(
                 workspaceName
             )  # compact the geodatabase to reduce its size and potentially improve the performance
-            arcpy.AddMessage("Compacted the geodatabase")
-        try:
-            itemList = []
-            featID = row.getValue("featID")
-            arcpy.AddMessage("working on feature: " + str(featID))
-            LwR = row.getValue("LengthWidthRatio")
-            area = row.getValue("Shape_Area")
-            arcpy.AddMessage("area: " + str(area))
-            whereClause = '"featID" = ' + str(featID)
-            inFeat = workspaceName + "/" + "inFeat_" + str(featID)
-            mergeList.append(inFeat)
+            addMessage("Compacted the geodatabase")
+        itemList = []
+        featID = row.getValue("featID")
+        addMessage("working on feature: " + str(featID), 2)
+        LwR = row.getValue("LengthWidthRatio")
+        area = row.getValue("Shape_Area")
+        addMessage("area: " + str(area), 2)
+        whereClause = f'"featID" = {featID}'
+        inFeat = f"{featPrefix}{featID}"
+        mergeList.append(inFeat)
 
+        try:
             # select the feature
             arcpy.Select_analysis(inFeatClass, inFeat, whereClause)
 
-            boundFeat = workspaceName + "/" + "boundFeat_" + str(featID)
+            boundFeat = f"{boundPrefix}{featID}"
             itemList.append(boundFeat)
 
             # select the feature
             arcpy.Select_analysis(MbrFeatClass, boundFeat, whereClause)
 
-            profilePointFC = workspaceName + "/" + "profilePointFC"
             itemList.append(profilePointFC)
 
             # depending on the following criteria, creating different profiles
             if (
                     area < areaThresholdValue
             ):  # for a smaller polygon feature, create only one profile. This would save time
-                time1 = datetime.now()
-                create_profiles3(
-                    inFeat, boundFeat, profilePointFC, tempFolder
-                )
-                time2 = datetime.now()
-                diff = time2 - time1
-                arcpy.AddMessage("took " + str(diff) + " to create profile3.")
+                with perfCounter("create_profiles3"):
+                    create_profiles3(inFeat, boundFeat, profilePointFC, tempFolder)
             elif (
                     LwR <= 5.0
             ):  # for a polygon feature that is not elongated, create five profiles passing through the polygon centre
-                time1 = datetime.now()
-                create_profiles1(
-                    inFeat, boundFeat, profilePointFC, tempFolder
-                )
-                time2 = datetime.now()
-                diff = time2 - time1
-                arcpy.AddMessage("took " + str(diff) + " to create profile1.")
+                with perfCounter("create_profiles1"):
+                    create_profiles1(inFeat, boundFeat, profilePointFC, tempFolder)
             else:  # for an elongated polygon feature, create five profiles across the long axis of the polygon
-                time1 = datetime.now()
-                create_profiles2(
-                    inFeat, boundFeat, profilePointFC, tempFolder
-                )
-                time2 = datetime.now()
-                diff = time2 - time1
-                arcpy.AddMessage("took " + str(diff) + " to create profile2.")
+                with perfCounter("create_profiles2"):
+                    create_profiles2(inFeat, boundFeat, profilePointFC, tempFolder)
 
             # extract depth values to profile points
-            profilePointFC1 = workspaceName + "/" + "profilePointFC1"
             itemList.append(profilePointFC1)
             ExtractValuesToPoints(profilePointFC, mosaicBathy, profilePointFC1)
-            arcpy.AddMessage("extract depth values done")
+            addMessage("extract depth values done", 2)
             # Add x and y
             arcpy.AddXY_management(profilePointFC1)
-            arcpy.AddMessage("Add x and y done")
+            addMessage("Add x and y done", 2)
             # export the table to a csv file
-            outCSV = tempFolder + "/" + "profilePointFC1.csv"
             itemList.append(outCSV)
             # delete schema.ini which may contains incorrect data types (2023-04-20)
-            schemaFile = tempFolder + "/" + "schema.ini"
             if os.path.isfile(schemaFile):
                 os.remove(schemaFile)
 
             arcpy.CopyRows_management(profilePointFC1, outCSV)
-            arcpy.AddMessage(outCSV + " is generated")
+            addMessage(outCSV + " is generated", 2)
             # read in the csv file as pandas dataframe
             points = pd.read_csv(outCSV, sep=",", header=0)
             points.set_index("OBJECTID", inplace=True)
-            # calculate profile attributes
-
-            profileIDList = np.unique(points.profileID)
-            shapeList = []
-            symmetryList = []
-            concaveList = []
-            bottomSlopeClassList = []
-            sideSlopeClassList = []
-            bottomDepthList = []
-            heightList = []
-            lengthList = []
-            # loop through each profile
-            for profileID in profileIDList:
-
-                pointsT = points.loc[points.profileID == profileID].copy()
-                depthCol = "RASTERVALU"
-                if pointsT.index.size > 10:
-                    gap = 4
-                else:
-                    gap = 3
-                # calling the 'calculate_profile_attributes_low' helper function
-                (
-                    shape,
-                    symmetry,
-                    concave,
-                    bottomSlopeClass,
-                    sideSlopeClass,
-                    bottomDepth,
-                    height,
-                    length,
-                ) = calculate_profile_attributes_low(
-                    pointsT, depthCol, "POINT_X", "POINT_Y", gap
-                )
-                shapeList.append(shape)
-                symmetryList.append(symmetry)
-                concaveList.append(concave)
-                bottomSlopeClassList.append(bottomSlopeClass)
-                sideSlopeClassList.append(sideSlopeClass)
-                bottomDepthList.append(bottomDepth)
-                heightList.append(height)
-                lengthList.append(length)
-
-            valueList = []
-            shape = ",".join(shapeList)
-            symmetry = ",".join(symmetryList)
-            concave = ",".join(concaveList)
-            bottomSlopeClass = ",".join(bottomSlopeClassList)
-            sideSlopeClass = ",".join(sideSlopeClassList)
-            bottomDepth = ",".join(bottomDepthList)
-            height = ",".join(heightList)
-            length = ",".join(lengthList)
-            valueList.append(shape)
-            valueList.append(symmetry)
-            valueList.append(concave)
-            valueList.append(bottomSlopeClass)
-            valueList.append(sideSlopeClass)
-            valueList.append(bottomDepth)
-            valueList.append(height)
-            valueList.append(length)
-            arcpy.AddMessage("profile attributes calculated")
-
-            for field in fieldList:
-                fieldType = "TEXT"
-                fieldLength = 200
-                fields = arcpy.ListFields(inFeat)
-                field_names = [f.name for f in fields]
-                if field in field_names:
-                    arcpy.AddMessage(field + " exists")
-                else:
-                    arcpy.AddField_management(
-                        inFeat, field, fieldType, field_length=fieldLength
-                    )
-
-            arcpy.AddMessage("profile fields added")
-
-            # calculate fields
-            i = 0
-            for field in fieldList:
-                # calculate string to a text field, the string must be enclosed by double quote
-                expression = '"' + valueList[i] + '"'
-                arcpy.CalculateField_management(
-                    inFeat, field, expression, "PYTHON_9.3"
-                )
-                i += 1
-
-            arcpy.AddMessage("profile fields calculated")
 
-            # delete intermediate data
+            # delete intermediate data, the profile points are now held in memory
             deleteDataItems(itemList)
-            arcpy.AddMessage("intermediate data deleted")
-
-        except:
-            arcpy.AddMessage("failed on " + str(featID))
+            addMessage("intermediate data deleted", 2)
+        except MemoryError:
+            raise
+        except Exception as e:
+            # any other failure in generating the profiles of a feature only skips that feature,
+            # e.g. create_profiles1() fails when the feature has no bounding rectangle
+            reportFailure(featID, e)
             continue
+
+        # calculate the profile attributes of this feature in the background,
+        # while the profile points of the next feature are being generated
+        future = executor.submit(
+            calculateProfileAttributes,
+            points,
+            calculate_profile_attributes_low,
+            len(fieldList),
+        )
+        # add the profile attributes of the previous feature
+        if pending is not None:
+            writeProfileAttributes(*pending, fieldList)
+        pending = (featID, inFeat, future)
         k += 1
 
+    # add the profile attributes of the last feature
+    if pending is not None:
+        writeProfileAttributes(*pending, fieldList)
+    executor.shutdown()
+    flushMessages()
+    flushProfileTimes()
     del cursor, row
     # merge all individual features together
     mergedFeat = "mergedFeat"
     arcpy.Merge_management(mergeList, mergedFeat)
     arcpy.AddMessage("merged all done")
 
-    # transfer the field values to inFeatClass
-
-    for field in fieldList:
-        inID = "featID"
-        joinID = "featID"
-        expression = "!" + mergedFeat + "." + field + "!"
-        addTextField(
-            inFeatClass, mergedFeat, field, inID, joinID, expression
-        )
+    # transfer the field values to inFeatClass, with a single join for all the fields
+    inID = "featID"
+    joinID = "featID"
+    fieldSpecs = [
+        [field, "TEXT", "!" + mergedFeat + "." + field + "!"] for field in fieldList
+    ]
+    addJoinedFields(inFeatClass, mergedFeat, inID, joinID, fieldSpecs)
 
     arcpy.AddMessage("Profile attributes added and calculated")
 
@@ -11,6 +11,8 @@ from arcpy import env
 from arcpy.sa import *
 from datetime import datetime
 from multiprocessing import Pool
+import os
+import heapq
 import multiprocessing
 # This math module must be imported in this script.
 # It is not used directly in this script, but used in the imported toolbox.
@@ -24,17 +26,17 @@ def addIDField(inFeat, fieldName):
     fieldType = "LONG"
     fieldPrecision = 15
 
-    fields = arcpy.ListFields(inFeat)
-    field_names = [f.name for f in fields]
-
-    if fieldName in field_names:
+    # only the fields matching the fieldName are listed
+    if arcpy.ListFields(inFeat, fieldName):
         arcpy.AddMessage(fieldName + " exists and will be recalculated")
     else:
         arcpy.AddField_management(inFeat, fieldName, fieldType, fieldPrecision)
 
-    expression = "!OBJECTID!"
-
-    arcpy.CalculateField_management(inFeat, fieldName, expression, "PYTHON_9.3")
+    # copy the OBJECTID values into the field with a cursor
+    with arcpy.da.UpdateCursor(inFeat, ["OID@", fieldName]) as cursor:
+        for row in cursor:
+            row[1] = row[0]
+            cursor.updateRow(row)
 
     arcpy.AddMessage(fieldName + " added and calculated")
     return
@@ -42,7 +44,7 @@ def addIDField(inFeat, fieldName):
 
 # This function creates temporary workspaces and folders,
 # splits the input bathymetric low featureclass into subsets,
-# copies a subset and input bathymetry and slope grids into each workspace,
+# writes a subset into each workspace,
 # and specifies temporary head and foot featureclasses
 def splitFeat(workspace, inFeat, inBathy, inSlope, noSplit):
     # workspace: the workspace which contains inFeat, inBathy and inSlope
@@ -51,24 +53,22 @@ def splitFeat(workspace, inFeat, inBathy, inSlope, noSplit):
     # inSlope: input slope grid
     # noSplit: the number of subsets to split the inFeat into
 
-    noFeat = int(arcpy.GetCount_management(inFeat).getOutput(0))
-    featCount = int(noFeat / noSplit)
-
     featList = []
     headFeatList = []
     footFeatList = []
-    bathyList = []
-    slopeList = []
     tempfolderList = []
     workspaceList = []
 
-    path = workspace.rstrip(workspace.split('/')[-1])
-    path = path.rstrip('/')
-    baseName = workspace.split('/')[-1]
-    baseName = baseName.split('.')[0]
-    inBathy = inBathy.split('/')[-1]
-    inSlope = inSlope.split('/')[-1]
-    inFeat = inFeat.split('/')[-1]
+    # the folder containing the workspace, where the temporary workspaces and folders are created
+    path = os.path.dirname(workspace)
+    baseName = os.path.splitext(os.path.basename(workspace))[0]
+    inBathy = os.path.basename(inBathy)
+    inSlope = os.path.basename(inSlope)
+    inFeat = os.path.basename(inFeat)
+    # the bathymetry and slope grids are only read by the workers,
+    # so all the subsets share the grids in the input workspace instead of each having its own copy
+    sharedBathy = os.path.join(workspace, inBathy)
+    sharedSlope = os.path.join(workspace, inSlope)
 
     # loop through subsets
     i = 1
@@ -78,38 +78,18 @@ def splitFeat(workspace, inFeat, inBathy, inSlope, noSplit):
         arcpy.CreateFileGDB_management(path, gdbName)
         arcpy.AddMessage(gdbName + ' created')
 
-        workspace = path + '/' + gdbName
-        workspaceList.append(workspace)
-
-        # copy inBathy
-        data1 = path + '/' + gdbName + '/' + inBathy
-        bathyList.append(data1)
-        arcpy.Copy_management(inBathy, data1)
-        arcpy.AddMessage(inBathy + ' copied')
-
-        # copy inSlope
-        data2 = path + '/' + gdbName + '/' + inSlope
-        slopeList.append(data2)
-        arcpy.Copy_management(inSlope, data2)
-        arcpy.AddMessage(inSlope + ' copied')
-
-        # select a subset of inFeat depending on the number of splits
-        startID = (i - 1) * featCount
-        if i == noSplit:
-            endID = noFeat
-        else:
-            endID = i * featCount
-        whereClause = '((OBJECTID > ' + str(startID) + ') And (OBJECTID <= ' + str(endID) + '))'
-        outFeat = path + '/' + gdbName + '/' + inFeat + '_' + str(i)
-        arcpy.analysis.Select(inFeat, outFeat, whereClause)
-        arcpy.AddMessage(outFeat + ' generated')
+        subsetWorkspace = os.path.join(path, gdbName)
+        workspaceList.append(subsetWorkspace)
+
+        # the subset of inFeat is written by partitionFeat() below
+        outFeat = os.path.join(subsetWorkspace, inFeat + '_' + str(i))
         featList.append(outFeat)
 
         # create temp folder
         folderName = 'temp' + str(i)
         arcpy.CreateFolder_management(path, folderName)
         arcpy.AddMessage(folderName + ' created')
-        tempFolder = path + '/' + folderName
+        tempFolder = os.path.join(path, folderName)
         tempfolderList.append(tempFolder)
         # specify head and foot featureclass variables
         headFeat = outFeat + '_head'
@@ -118,65 +98,128 @@ def splitFeat(workspace, inFeat, inBathy, inSlope, noSplit):
         footFeatList.append(footFeat)
 
         i += 1
-    return workspaceList, tempfolderList, featList, headFeatList, footFeatList, bathyList, slopeList
 
+    # split inFeat into subsets of similar total area
+    partitionFeat(inFeat, featList)
+    return workspaceList, tempfolderList, featList, headFeatList, footFeatList, sharedBathy, sharedSlope
+
+
+# This function splits the input featureclass into subsets of similar total area,
+# as the time taken to calculate the attributes of a feature grows with its area
+# The features are assigned to the subsets with the longest-processing-time-first rule:
+# from the largest to the smallest, each feature goes to the subset with the smallest total area so far
+def partitionFeat(inFeat, outFeatList):
+    # inFeat: input featureclass
+    # outFeatList: a list of output featureclasses, one for each subset
+
+    noSplit = len(outFeatList)
+    with arcpy.da.SearchCursor(inFeat, ["OID@", "SHAPE@AREA"]) as cursor:
+        featAreas = sorted(cursor, key=lambda row: row[1], reverse=True)
+    # a heap of (total area, subset index) pairs, the subset with the smallest total area is at the top
+    subsetHeap = [(0.0, i) for i in range(noSplit)]
+    subsetIndex = {}
+    for oid, area in featAreas:
+        totalArea, i = heapq.heappop(subsetHeap)
+        subsetIndex[oid] = i
+        heapq.heappush(subsetHeap, (totalArea + area, i))
+
+    desc = arcpy.Describe(inFeat)
+    fieldNames = [
+        f.name for f in desc.fields if f.editable and f.type not in ("OID", "Geometry")
+    ]
+    cursorFields = ["SHAPE@"] + fieldNames
+
+    # create an empty featureclass with the same schema for each subset
+    insertCursors = []
+    for outFeat in outFeatList:
+        outPath, outName = os.path.split(outFeat)
+        arcpy.CreateFeatureclass_management(
+            outPath,
+            outName,
+            desc.shapeType,
+            inFeat,
+            "SAME_AS_TEMPLATE",
+            "SAME_AS_TEMPLATE",
+            desc.spatialReference,
+        )
+        insertCursors.append(arcpy.da.InsertCursor(outFeat, cursorFields))
+
+    try:
+        # a single scan of inFeat writes each feature into its subset
+        with arcpy.da.SearchCursor(
+            inFeat, ["OID@"] + cursorFields, sql_clause=(None, "ORDER BY OBJECTID")
+        ) as cursor:
+            for row in cursor:
+                insertCursors[subsetIndex[row[0]]].insertRow(row[1:])
+    finally:
+        # release the insert cursors so that the featureclasses are not locked
+        del insertCursors
+    for outFeat in outFeatList:
+        arcpy.AddMessage(outFeat + ' generated')
+    return
 
-# This function calculates shape attributes for the bathymetric low features
-def add_shape_attributes_low_function(arg):
-    """ pass a list of arguments"""
-    workspaceName = arg[0]
-    tempFolder = arg[1]
-    inFeat = arg[2]
-    headFeat = arg[3]
-    footFeat = arg[4]
-    inBathy = arg[5]
-    additionalAttributes = arg[8]
-    # importing the AddAttributes toolbox to calculate the shape attributes
-    arcpy.ImportToolbox("C:/Tools/multiprocess_test/AddAttributes.pyt")
-    env.workspace = workspaceName
-    env.overwriteOutput = True
-    arcpy.AddAttributes.Add_Shape_Attributes_Low_Tool(inFeat, inBathy, tempFolder, headFeat, footFeat,
-                                                      additionalAttributes)
 
+# the parameters shared by all the subsets, set once in each worker by setWorkerParameters()
+workerParameters = {}
+
+
+# This function sets the parameters shared by all the subsets
+def setWorkerParameters(inBathy, inSlope, areaT, additionalAttributes):
+    # inBathy: input bathymetry grid shared by all the subsets
+    # inSlope: input slope grid shared by all the subsets
+    # areaT: area threshold used to calculate the profile attributes
+    # additionalAttributes: whether to add additional shape attributes
+
+    workerParameters.update(
+        inBathy=inBathy,
+        inSlope=inSlope,
+        areaT=areaT,
+        additionalAttributes=additionalAttributes,
+    )
     return
 
 
-# This function calculates topographic attributes for the bathymetric low features
-def add_topographic_attributes_low_function(arg):
-    """ pass a list of arguments"""
-    workspaceName = arg[0]
-    inFeat = arg[2]
-    headFeat = arg[3]
-    footFeat = arg[4]
-    inBathy = arg[5]
-    inSlope = arg[6]
-    # importing the AddAttributes toolbox to calculate the topographic attributes
+# This function initialises a worker process of the pool
+# The AddAttributes toolbox is imported and the shared parameters are set once in each worker, instead of once for each task
+def init_worker(inBathy, inSlope, areaT, additionalAttributes):
+    # importing the AddAttributes toolbox to calculate the attributes
     arcpy.ImportToolbox("C:/Tools/multiprocess_test/AddAttributes.pyt")
-    env.workspace = workspaceName
-    env.overwriteOutput = True
-    arcpy.AddAttributes.Add_Topographic_Attributes_Low_Tool(inFeat, inBathy, inSlope, headFeat, footFeat)
-
+    setWorkerParameters(inBathy, inSlope, areaT, additionalAttributes)
     return
 
 
-# This function calculates profile attributes for the bathymetric low features
-def add_profile_attributes_low_function(arg):
-    """ pass a featureclass"""
+# This function calculates shape, topographic and profile attributes for the bathymetric low features
+# The three stages run one after another in the same worker, so that a subset does not wait for the other subsets between the stages
+def add_attributes_low_function(arg):
+    """ pass a tuple of arguments"""
     workspaceName = arg[0]
     tempFolder = arg[1]
     inFeat = arg[2]
-    inBathy = arg[5]
-    areaT = arg[7]
-    # importing the AddAttributes toolbox to calculate the profile attributes
-    arcpy.ImportToolbox("C:/Tools/multiprocess_test/AddAttributes.pyt")
+    headFeat = arg[3]
+    footFeat = arg[4]
+    inBathy = workerParameters["inBathy"]
+    inSlope = workerParameters["inSlope"]
+    areaT = workerParameters["areaT"]
+    additionalAttributes = workerParameters["additionalAttributes"]
+    # the AddAttributes toolbox has been imported and the shared parameters have been set by init_worker()
     env.workspace = workspaceName
     env.overwriteOutput = True
+    arcpy.AddAttributes.Add_Shape_Attributes_Low_Tool(inFeat, inBathy, tempFolder, headFeat, footFeat,
+                                                      additionalAttributes)
+    arcpy.AddAttributes.Add_Topographic_Attributes_Low_Tool(inFeat, inBathy, inSlope, headFeat, footFeat)
     arcpy.AddAttributes.Add_Profile_Attributes_Low_Tool(inFeat, inBathy, areaT, tempFolder)
+    # release the locks this worker holds on the subset workspace, so that the workspace can be deleted later
+    arcpy.ClearWorkspaceCache_management()
 
     return
 
+
+
 # main function
 if __name__ == '__main__':
+    # the workers are always started with a fresh interpreter (the default on Windows),
+    # rather than as forked copies of this process and its arcpy state
+    multiprocessing.set_start_method('spawn', force=True)
     # report a message
     print('Starting task...')
     time1 = datetime.now()
@@ -205,76 +248,68 @@ if __name__ == '__main__':
 
     workspaceName = env.workspace
 
-    fields = arcpy.ListFields(inFeatClass)
-    field_names = [f.name for f in fields]
     # check the 'featID' field exists
     # if not, add and calculate it
-    if "featID" not in field_names:
+    if not arcpy.ListFields(inFeatClass, "featID"):
         arcpy.AddMessage("Adding an unique featID...")
         addIDField(inFeatClass, "featID")
 
     # call the splitFeat() to split the input features into subsets, copy bathy and slope, etc
-    workspaceList, tempfolderList, featList, headFeatList, footFeatList, bathyList, slopeList = splitFeat(
+    workspaceList, tempfolderList, featList, headFeatList, footFeatList, sharedBathy, sharedSlope = splitFeat(
         workspaceName, inFeatClass, inBathy, inSlope, nCPU)
+    # the parameters shared by all the subsets are passed to the workers once, only the subset items are passed for each task
+    workerArgs = (sharedBathy, sharedSlope, areaT, additionalAttributes)
     # building argList
-    argList = []
-    i = 0
-    while i < len(featList):
-        argList.append(
-            [workspaceList[i], tempfolderList[i], featList[i], headFeatList[i], footFeatList[i], bathyList[i],
-             slopeList[i], areaT, additionalAttributes])
-        i += 1
-
-    print(argList)
-    # create the process pool for multiprocessing
-
-    # calculating shape attributes
-    arcpy.AddMessage('calculating shape attributes ...')
-    with Pool(nCPU) as pool:
-        # perform calculations
-        results1 = pool.map(add_shape_attributes_low_function, argList)
-
-    # calculating topographic attributes
-    arcpy.AddMessage('calculating topographic attributes ...')
-    with Pool(nCPU) as pool:
-        # perform calculations
-        results2 = pool.map(add_topographic_attributes_low_function, argList)
-
-    # calculating profile attributes
-    arcpy.AddMessage('calculating profile attributes ...')
-    with Pool(nCPU) as pool:
-        # perform calculations
-        results3 = pool.map(add_profile_attributes_low_function, argList)
-
-    # merge the subsets of the input features
-    outFeatClass = "mergedFeat"
-    arcpy.Merge_management(featList, outFeatClass)
-    outFeatClass1 = "mergedFeat1"
-    arcpy.Merge_management(headFeatList, outFeatClass1)
-    outFeatClass2 = "mergedFeat2"
-    arcpy.Merge_management(footFeatList, outFeatClass2)
+    argList = list(zip(workspaceList, tempfolderList, featList, headFeatList, footFeatList))
+
+    arcpy.AddMessage("Dispatching " + str(len(argList)) + " subsets")
+
+    # calculating shape, topographic and profile attributes
+    arcpy.AddMessage('calculating shape, topographic and profile attributes ...')
+    if nCPU == 1:
+        # with a single CPU there is nothing to run in parallel, the subset is processed in this process
+        # the toolbox has already been imported above
+        setWorkerParameters(*workerArgs)
+        for arg in argList:
+            add_attributes_low_function(arg)
+        # the worker function changes the workspace to the subset workspace
+        env.workspace = workspaceName
+    else:
+        # each worker is replaced by a fresh one after a task, so that the memory and locks held by ArcGIS are released
+        pool = Pool(nCPU, initializer=init_worker, initargs=workerArgs, maxtasksperchild=1)
+        # perform calculations, the subsets are handed out one at a time as the workers become free
+        for _ in pool.imap_unordered(add_attributes_low_function, argList, chunksize=1):
+            pass
+        # the pool is only used for the attribute calculations,
+        # starting a worker (and importing the toolbox) costs more than the merges and deletions below
+        pool.close()
+        pool.join()
+
+    # merge the subsets of the input features directly into the final featureclasses,
+    # the subsets in the temporary workspaces are kept until the merges have succeeded
+    # the merges run one after another, as creating featureclasses in the same file geodatabase at the same time
+    # can fail on the schema lock
+    mergeList = [
+        (featList, inFeatClass),
+        (headFeatList, headFeatClass),
+        (footFeatList, footFeatClass),
+    ]
+    for subsetList, outFeatClass in mergeList:
+        if arcpy.Exists(outFeatClass):
+            arcpy.Delete_management(outFeatClass)
+        arcpy.Merge_management(subsetList, outFeatClass)
     arcpy.AddMessage('final merge done')
-    # copy the merged features and replace the input featureclass
-    arcpy.Copy_management(outFeatClass, inFeatClass)
-    arcpy.Copy_management(outFeatClass1, headFeatClass)
-    arcpy.Copy_management(outFeatClass2, footFeatClass)
-    arcpy.AddMessage('final copy done')
-    arcpy.Delete_management(outFeatClass)
-    arcpy.Delete_management(outFeatClass1)
-    arcpy.Delete_management(outFeatClass2)
-
-    # compact the geodatabase to reduce its size
-    arcpy.Compact_management(workspaceName)
-    arcpy.AddMessage("Compacted the geodatabase")
 
     # delete all temporary workspaces and folders
-    for workspace in workspaceList:
-        arcpy.Delete_management(workspace)
-    arcpy.AddMessage("All temporary workspaces are deleted")
-
-    for folder in tempfolderList:
-        arcpy.Delete_management(folder)
-    arcpy.AddMessage("All temporary folders are deleted")
+    for item in workspaceList + tempfolderList:
+        arcpy.Delete_management(item)
+    arcpy.AddMessage("All temporary workspaces and folders are deleted")
+
+    # compact the geodatabase to reduce its size,
+    # after the workers have exited and the temporary items are deleted so that no lock is left on the geodatabase
+    if arcpy.Describe(workspaceName).workspaceType == "LocalDatabase":
+        arcpy.Compact_management(workspaceName)
+        arcpy.AddMessage("Compacted the geodatabase")
 
     time2 = datetime.now()
     diff = time2 - time1